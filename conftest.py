@@ -0,0 +1,40 @@
+"""
+Session-wide pytest fixtures
+Lives at the repo root so both tests/ and the top-level setup scripts
+(test_postgres_full.py, test_redis_connection.py) share one engine and client
+"""
+
+import pytest
+
+from tests._helpers import get_engine, get_redis, pg_url
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    """SQLAlchemy engine shared by every PostgreSQL test"""
+    if not pg_url():
+        pytest.skip("No PostgreSQL URL configured")
+    engine = get_engine()
+    # Connect once so an unreachable server skips the tests instead of failing each one
+    try:
+        with engine.connect():
+            pass
+    except Exception as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+    return engine
+
+
+@pytest.fixture(scope="session")
+def redis_client():
+    """Redis client shared by every Redis test"""
+    import redis
+    from config.settings import REDIS_URL
+
+    if not REDIS_URL:
+        pytest.skip("No Redis URL configured")
+    client = get_redis()
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        pytest.skip(f"Redis not reachable: {e}")
+    return client
@@ -66,6 +66,9 @@ try:
 except Exception:
     pass
 
+# Imported after load_dotenv so .env values reach config.settings
+from config.settings import CORS_ORIGINS_LIST  # parsed once; sorted for Flask-CORS
+
 # -------- Optional PDF deps (ReportLab) --------
 _REPORTLAB_AVAILABLE = False
 try:
@@ -97,10 +100,6 @@ GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 FERNET_KEY = os.getenv("FERNET_KEY")
 fernet = Fernet(FERNET_KEY.encode()) if FERNET_KEY else None
 
-CORS_ORIGINS = os.getenv(
-    "CORS_ORIGINS",
-    "http://127.0.0.1:5500,http://localhost:5500,http://localhost:5173,http://127.0.0.1:5173,https://convoinsight.vercel.app",
-).split(",")
 
 DATASETS_ROOT = os.getenv("DATASETS_ROOT", os.path.abspath("./datasets"))
 CHARTS_ROOT = os.getenv("CHARTS_ROOT", os.path.abspath("./charts"))
@@ -140,7 +139,7 @@ if SUPABASE_URL and SUPABASE_KEY:
 
 # --- Init Flask ---
 app = Flask(__name__)
-CORS(app, origins=[o.strip() for o in CORS_ORIGINS if o.strip()], supports_credentials=True)
+CORS(app, origins=CORS_ORIGINS_LIST, supports_credentials=True)
 
 # --- Init GCP clients ---
 _storage_client = storage.Client(project=GCP_PROJECT_ID) if GCP_PROJECT_ID else storage.Client()
@@ -1,58 +1,183 @@
 """
 Cache Middleware - Redis-backed caching layer
-Provides function-level caching with configurable TTL
+Provides function-level caching with configurable TTL,
+a short-lived in-process L1 in front of Redis and write-behind for sets
 """
 
 import redis
-import json
-import hashlib
+import orjson
+import xxhash
+import atexit
+import math
+import queue
+import threading
+import time
+from collections import Counter
+from cachetools import TLRUCache
+from datetime import date, datetime
+from uuid import UUID
 from functools import wraps
-from typing import Optional, Callable, Any
+from typing import Optional, Callable, Any, Iterable
 import logging
 
 # Import from config
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-from config.settings import REDIS_URL, CACHE_ENABLED, CACHE_TTL
+from config.settings import (
+    REDIS_URL, CACHE_ENABLED, CACHE_TTL, CACHE_L1_SIZE, CACHE_L1_TTL, CACHE_WRITE_BEHIND,
+)
+from src.middleware.redis_pool import get_pool
 
 logger = logging.getLogger(__name__)
 
+# Redis SET per tag listing the cache keys that belong to it
+TAG_KEY_PREFIX = "tag:"
+
+# Keys per SCAN page / UNLINK call in invalidate_pattern
+INVALIDATE_BATCH_SIZE = 500
+
+# Write-behind: queued sets are pipelined every WRITE_BATCH_SIZE items or
+# WRITE_FLUSH_INTERVAL seconds; a full queue falls back to a synchronous write
+WRITE_QUEUE_SIZE = 10_000
+WRITE_BATCH_SIZE = 50
+WRITE_FLUSH_INTERVAL = 0.02
+# get_stats() result lifetime, so metrics scrapers don't hit INFO each call
+STATS_CACHE_TTL = 1.0
+
+# Integer range orjson can serialize; larger ints are tagged in cache keys
+_INT64_MIN = -(2 ** 63)
+_UINT64_MAX = 2 ** 64 - 1
+
+# 1-byte type tag prepended to every stored payload
+_TYPE_JSON = b"\x00"
+_TYPE_BYTES = b"\x01"
+_TYPE_STR = b"\x02"
+
+
+def _encode(value: Any) -> bytes:
+    """Serialize a value for Redis; bytes and str skip JSON entirely"""
+    if isinstance(value, (bytes, bytearray)):
+        return _TYPE_BYTES + bytes(value)
+    if isinstance(value, str):
+        return _TYPE_STR + value.encode()
+    # orjson returns bytes and handles datetime/UUID natively; default=str covers the rest
+    return _TYPE_JSON + orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _decode(data: bytes) -> Any:
+    """Deserialize a payload written by _encode"""
+    type_tag, payload = data[:1], data[1:]
+    if type_tag == _TYPE_JSON:
+        return orjson.loads(payload)
+    if type_tag == _TYPE_BYTES:
+        return payload
+    if type_tag == _TYPE_STR:
+        return payload.decode()
+    # Untagged JSON written before type tags were introduced
+    return orjson.loads(data)
+
 
 class CacheManager:
     """
     Redis-backed cache manager with automatic serialization
+
+    Hot keys are also kept in a per-process L1 (serialized bytes, bounded size
+    and TTL) so repeated reads skip the Redis round-trip. Entries written by
+    other processes may be served stale for up to l1_ttl seconds.
+
+    With write_behind, set() hands the write to a background thread and
+    returns immediately; other processes see the value a few ms later.
+    Deletes and invalidations flush pending writes first, so they are never
+    overtaken by an earlier set.
     """
 
-    def __init__(self, redis_url: str, enabled: bool = True):
+    def __init__(
+        self,
+        redis_url: str,
+        enabled: bool = True,
+        l1_size: int = 4096,
+        l1_ttl: int = 10,
+        write_behind: bool = False,
+    ):
         """
         Initialize cache manager
 
         Args:
             redis_url: Redis connection URL
             enabled: Whether caching is enabled
+            l1_size: Maximum number of entries in the in-process L1
+            l1_ttl: L1 entry lifetime in seconds (0 disables the L1)
+            write_behind: Queue set() writes for a background thread
         """
         self.enabled = enabled
         self.redis_url = redis_url
         self._redis = None
-
-        if self.enabled:
-            try:
-                self._redis = redis.from_url(redis_url, decode_responses=True)
-                # Test connection
-                self._redis.ping()
-                logger.info(f"Cache manager initialized successfully (Redis: {redis_url})")
-            except Exception as e:
-                logger.warning(f"Failed to connect to Redis, caching disabled: {e}")
-                self.enabled = False
+        self._init_lock = threading.Lock()
+        self._l1_ttl = l1_ttl
+        # Entries are (data, lifetime); each expires after its own lifetime
+        self._l1 = TLRUCache(maxsize=l1_size, ttu=self._l1_ttu) if l1_ttl > 0 else None
+        self._l1_lock = threading.Lock()
+        self._write_behind = write_behind
+        self._write_q = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = None
+        # Queued-but-unwritten sets per key, so a synchronous set only waits
+        # for the writer when it would otherwise be overwritten
+        self._pending = Counter()
+        self._pending_cond = threading.Condition()
+        self._stats_cache = None
+        if write_behind:
+            atexit.register(self._flush)
 
     @property
     def redis(self):
-        """Get Redis client, lazy initialization"""
-        if not self.enabled or self._redis is None:
+        """Get Redis client, lazy initialization (connects on first use)"""
+        if self._redis is None and self.enabled:
+            with self._init_lock:
+                if self._redis is None and self.enabled:
+                    try:
+                        client = redis.Redis(connection_pool=get_pool(self.redis_url))
+                        # Test connection
+                        client.ping()
+                        self._redis = client
+                        logger.info(f"Cache manager initialized successfully (Redis: {self.redis_url})")
+                    except Exception as e:
+                        logger.warning(f"Failed to connect to Redis, caching disabled: {e}")
+                        self.enabled = False
+        if not self.enabled:
             return None
         return self._redis
 
+    @staticmethod
+    def _l1_ttu(_key: str, entry: tuple, now: float) -> float:
+        """Expiry time of an L1 entry"""
+        return now + entry[1]
+
+    def _l1_get(self, key: str) -> Optional[bytes]:
+        """Get serialized value from the in-process L1"""
+        if self._l1 is None:
+            return None
+        with self._l1_lock:
+            entry = self._l1.get(key)
+        return entry[0] if entry is not None else None
+
+    def _l1_set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        """Store serialized value in the in-process L1, for at most ttl seconds"""
+        if self._l1 is None:
+            return
+        lifetime = self._l1_ttl if ttl is None else min(self._l1_ttl, ttl)
+        if lifetime <= 0:
+            return
+        with self._l1_lock:
+            self._l1[key] = (data, lifetime)
+
+    def _l1_evict(self, key: Optional[str] = None):
+        """Evict one key from the in-process L1, or everything if key is None"""
+        if self._l1 is None:
+            return
+        with self._l1_lock:
+            if key is None:
+                self._l1.clear()
+            else:
+                self._l1.pop(key, None)
+
     def get(self, key: str) -> Optional[Any]:
         """
         Get value from cache
@@ -67,35 +192,147 @@ class CacheManager:
             return None
 
         try:
-            data = self.redis.get(key)
+            data = self._l1_get(key)
+            if data is not None:
+                logger.debug(f"Cache L1 HIT: {key}")
+                return _decode(data)
+
+            # PTTL in the same round-trip so L1 never outlives the Redis entry
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            data, pttl = pipe.execute()
             if data:
                 logger.debug(f"Cache HIT: {key}")
-                return json.loads(data)
+                # -1: no expiry, so the L1 default applies; -2: expired after the GET
+                remaining = None if pttl == -1 else max(pttl, 0) / 1000
+                self._l1_set(key, data, remaining)
+                return _decode(data)
             logger.debug(f"Cache MISS: {key}")
             return None
         except Exception as e:
             logger.error(f"Cache get error for key '{key}': {e}")
             return None
 
-    def set(self, key: str, value: Any, ttl: int = 300):
+    def set(self, key: str, value: Any, ttl: int = 300, tags: Optional[Iterable[str]] = None):
         """
         Set value in cache with TTL
 
         Args:
             key: Cache key
-            value: Value to cache (must be JSON-serializable)
+            value: Value to cache (bytes/str stored as-is, anything else as JSON;
+                   unknown types fall back to str)
             ttl: Time-to-live in seconds
+            tags: Tags to register the key under (see invalidate_tag)
         """
         if not self.enabled or self.redis is None:
             return
 
         try:
-            serialized = json.dumps(value, default=str)  # default=str handles datetime, etc.
-            self.redis.setex(key, ttl, serialized)
+            serialized = _encode(value)
+            entry = (key, ttl, serialized, tags)
+            # Don't let the L1 outlive a shorter Redis TTL
+            in_l1 = self._l1 is not None and ttl >= self._l1_ttl
+            # Only defer the write when L1 can answer reads until it lands
+            if not (in_l1 and self._enqueue_write(entry)):
+                # An older queued set for this key must land first, or it would
+                # overwrite this one afterwards; other keys don't need to wait
+                self._wait_for_key(key)
+                # One round-trip for the value and its tag memberships
+                pipe = self.redis.pipeline(transaction=False)
+                self._queue_set(pipe, entry)
+                pipe.execute()
+            if in_l1:
+                self._l1_set(key, serialized)
+            else:
+                self._l1_evict(key)
             logger.debug(f"Cache SET: {key} (TTL: {ttl}s)")
         except Exception as e:
             logger.error(f"Cache set error for key '{key}': {e}")
 
+    @staticmethod
+    def _queue_set(pipe, entry: tuple):
+        """Add SETEX (and tag registration) for one entry to a pipeline"""
+        key, ttl, serialized, tags = entry
+        pipe.setex(key, ttl, serialized)
+        if tags:
+            for tag in tags:
+                tag_key = f"{TAG_KEY_PREFIX}{tag}"
+                pipe.sadd(tag_key, key)
+                pipe.expire(tag_key, ttl * 2)
+
+    def _enqueue_write(self, entry: tuple) -> bool:
+        """Hand a set to the background writer; False means write synchronously"""
+        if not self._write_behind:
+            return False
+        if self._writer is None or not self._writer.is_alive():
+            with self._init_lock:
+                # Also restarts the writer in a forked worker
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(
+                        target=self._writer_loop, name="cache-writer", daemon=True
+                    )
+                    self._writer.start()
+        with self._pending_cond:
+            try:
+                self._write_q.put_nowait(entry)
+            except queue.Full:
+                return False
+            self._pending[entry[0]] += 1
+        return True
+
+    def _writer_loop(self):
+        """Drain queued sets into non-transactional pipelines"""
+        while True:
+            batch = [self._write_q.get()]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._write_q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if not isinstance(item, threading.Event)]
+            if entries:
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for entry in entries:
+                        self._queue_set(pipe, entry)
+                    pipe.execute()
+                    logger.debug(f"Cache write-behind: {len(entries)} keys")
+                except Exception as e:
+                    logger.error(f"Cache write-behind error ({len(entries)} keys dropped): {e}")
+                with self._pending_cond:
+                    for key, *_ in entries:
+                        self._pending[key] -= 1
+                        if not self._pending[key]:
+                            del self._pending[key]
+                    self._pending_cond.notify_all()
+
+            # Flush markers are signalled only after everything queued before them is written
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _flush(self, timeout: float = 5.0):
+        """Block until every set queued so far has reached Redis"""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._write_q.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _wait_for_key(self, key: str, timeout: float = 5.0):
+        """Block until no queued set for key is still waiting for the writer"""
+        with self._pending_cond:
+            self._pending_cond.wait_for(lambda: not self._pending[key], timeout)
+
     def delete(self, key: str):
         """
         Delete a single key from cache
@@ -107,6 +344,8 @@ class CacheManager:
             return
 
         try:
+            self._flush()
+            self._l1_evict(key)
             self.redis.delete(key)
             logger.debug(f"Cache DELETE: {key}")
         except Exception as e:
@@ -123,21 +362,58 @@ class CacheManager:
             return
 
         try:
+            self._flush()
+            # Redis glob semantics differ slightly from fnmatch; drop the whole L1
+            self._l1_evict()
             deleted_count = 0
-            for key in self.redis.scan_iter(match=pattern):
-                self.redis.delete(key)
-                deleted_count += 1
+            batch = []
+            for key in self.redis.scan_iter(match=pattern, count=INVALIDATE_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= INVALIDATE_BATCH_SIZE:
+                    # UNLINK frees memory in a background thread instead of blocking Redis
+                    self.redis.unlink(*batch)
+                    deleted_count += len(batch)
+                    batch.clear()
+            if batch:
+                self.redis.unlink(*batch)
+                deleted_count += len(batch)
             logger.info(f"Cache INVALIDATE: {pattern} ({deleted_count} keys)")
         except Exception as e:
             logger.error(f"Cache invalidate error for pattern '{pattern}': {e}")
 
+    def invalidate_tag(self, tag: str):
+        """
+        Invalidate all keys registered under a tag
+
+        Cost is proportional to the number of tagged keys, not the keyspace.
+
+        Args:
+            tag: Tag passed to set() / @cached(tags=...)
+        """
+        if not self.enabled or self.redis is None:
+            return
+
+        try:
+            self._flush()
+            tag_key = f"{TAG_KEY_PREFIX}{tag}"
+            members = self.redis.smembers(tag_key)
+            for member in members:
+                self._l1_evict(member.decode())
+            # UNLINK frees memory in a background thread instead of blocking Redis
+            self.redis.unlink(*members, tag_key)
+            logger.info(f"Cache INVALIDATE TAG: {tag} ({len(members)} keys)")
+        except Exception as e:
+            logger.error(f"Cache invalidate error for tag '{tag}': {e}")
+
     def flush_all(self):
         """Flush all cache (use with caution)"""
         if not self.enabled or self.redis is None:
             return
 
         try:
-            self.redis.flushdb()
+            self._flush()
+            self._l1_evict()
+            self.redis.flushdb(asynchronous=True)
             logger.warning("Cache FLUSH: All keys deleted")
         except Exception as e:
             logger.error(f"Cache flush error: {e}")
@@ -147,47 +423,113 @@ class CacheManager:
         if not self.enabled or self.redis is None:
             return {"enabled": False}
 
+        cached = self._stats_cache
+        if cached is not None and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return cached[1]
+
         try:
             info = self.redis.info("stats")
-            return {
+            hits = info.get("keyspace_hits", 0)
+            misses = info.get("keyspace_misses", 0)
+            denom = hits + misses
+            stats = {
                 "enabled": True,
                 "total_commands": info.get("total_commands_processed", 0),
-                "keyspace_hits": info.get("keyspace_hits", 0),
-                "keyspace_misses": info.get("keyspace_misses", 0),
-                "hit_rate": (
-                    info.get("keyspace_hits", 0) /
-                    (info.get("keyspace_hits", 0) + info.get("keyspace_misses", 1))
-                )
+                "keyspace_hits": hits,
+                "keyspace_misses": misses,
+                "hit_rate": hits / denom if denom else 0.0,
             }
+            self._stats_cache = (time.monotonic(), stats)
+            return stats
         except Exception as e:
             logger.error(f"Failed to get cache stats: {e}")
             return {"enabled": True, "error": str(e)}
 
 
 # Global cache instance
-cache_manager = CacheManager(REDIS_URL, enabled=CACHE_ENABLED)
+cache_manager = CacheManager(
+    REDIS_URL,
+    enabled=CACHE_ENABLED,
+    l1_size=CACHE_L1_SIZE,
+    l1_ttl=CACHE_L1_TTL,
+    write_behind=CACHE_WRITE_BEHIND,
+)
 
 
-def cached(key_prefix: str, ttl: Optional[int] = None):
+def _norm(value: Any) -> Any:
+    """
+    Normalize one argument to a JSON-native value for key hashing
+
+    Non-string values are tagged (["__uuid__", ...], ["__repr__", ...]) so they
+    can never hash the same as a plain string argument. Ints outside the 64-bit
+    range and non-finite floats are tagged too: orjson rejects the former and
+    writes the latter as null.
+    """
+    if value is None or isinstance(value, (str, bool)):
+        return value
+    if isinstance(value, int):
+        return value if _INT64_MIN <= value <= _UINT64_MAX else ["__int__", str(value)]
+    if isinstance(value, float):
+        return value if math.isfinite(value) else ["__float__", repr(value)]
+    if isinstance(value, (list, tuple)):
+        return [_norm(item) for item in value]
+    if isinstance(value, dict):
+        # Key order doesn't matter; keys are normalized too (they may not be str)
+        items = [[_norm(k), _norm(v)] for k, v in value.items()]
+        return ["__dict__", sorted(items, key=orjson.dumps)]
+    if isinstance(value, UUID):
+        return ["__uuid__", value.hex]
+    if isinstance(value, (datetime, date)):
+        return ["__datetime__", value.isoformat()]
+    return ["__repr__", repr(value)]
+
+
+def _hash_args(args: tuple, kwargs: dict) -> str:
+    """Hash call arguments into a short, order-independent (for kwargs) hex digest"""
+    key_data = orjson.dumps((
+        [_norm(arg) for arg in args],
+        [(name, _norm(value)) for name, value in sorted(kwargs.items())],
+    ))
+    return xxhash.xxh3_128_hexdigest(key_data)
+
+
+def cached(key_prefix: str, ttl: Optional[int] = None, tags: Optional[Iterable[str]] = None):
     """
     Decorator for caching function results
 
     Args:
         key_prefix: Prefix for cache key (e.g., "dataset:list")
         ttl: Time-to-live in seconds (uses CACHE_TTL config if not specified)
+        tags: Tags for bulk invalidation via invalidate_tag()
 
     Example:
-        @cached("user:profile", ttl=600)
+        @cached("user:profile", ttl=600, tags=["users"])
         def get_user_profile(user_id: str):
             return fetch_from_db(user_id)
     """
+    tags = tuple(tags) if tags else ()
+
+    # Resolve TTL once; it only depends on key_prefix
+    effective_ttl = ttl
+    if effective_ttl is None:
+        # Try to match key_prefix with CACHE_TTL config
+        for config_key, config_ttl in CACHE_TTL.items():
+            if config_key in key_prefix:
+                effective_ttl = config_ttl
+                break
+        if effective_ttl is None:
+            effective_ttl = 300  # Default 5 minutes
+
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key from function args
-            key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True, default=str)
-            key_hash = hashlib.md5(key_data.encode()).hexdigest()
-            cache_key = f"{key_prefix}:{key_hash}"
+            # Generate cache key from function args; if they can't be hashed,
+            # run uncached rather than failing the call
+            try:
+                cache_key = f"{key_prefix}:{_hash_args(args, kwargs)}"
+            except Exception as e:
+                logger.warning(f"Cache key error for '{key_prefix}', calling uncached: {e}")
+                return func(*args, **kwargs)
 
             # Try to get from cache
             cached_result = cache_manager.get(cache_key)
@@ -197,19 +539,8 @@ def cached(key_prefix: str, ttl: Optional[int] = None):
             # Execute function
             result = func(*args, **kwargs)
 
-            # Determine TTL
-            effective_ttl = ttl
-            if effective_ttl is None:
-                # Try to match key_prefix with CACHE_TTL config
-                for config_key, config_ttl in CACHE_TTL.items():
-                    if config_key in key_prefix:
-                        effective_ttl = config_ttl
-                        break
-                if effective_ttl is None:
-                    effective_ttl = 300  # Default 5 minutes
-
             # Cache result
-            cache_manager.set(cache_key, result, ttl=effective_ttl)
+            cache_manager.set(cache_key, result, ttl=effective_ttl, tags=tags)
 
             return result
 
@@ -225,10 +556,9 @@ def cache_key(*args, **kwargs) -> str:
         *args, **kwargs: Arguments to hash
 
     Returns:
-        MD5 hash of arguments
+        xxh3-128 hash of arguments
     """
-    key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True, default=str)
-    return hashlib.md5(key_data.encode()).hexdigest()
+    return _hash_args(args, kwargs)
 
 
 def invalidate_cache(pattern: str):
@@ -241,6 +571,16 @@ def invalidate_cache(pattern: str):
     cache_manager.invalidate_pattern(pattern)
 
 
+def invalidate_tag(tag: str):
+    """
+    Invalidate cache by tag
+
+    Args:
+        tag: Tag used with @cached(tags=...)
+    """
+    cache_manager.invalidate_tag(tag)
+
+
 # Export for convenience
 __all__ = [
     'CacheManager',
@@ -248,4 +588,5 @@ __all__ = [
     'cached',
     'cache_key',
     'invalidate_cache',
+    'invalidate_tag',
 ]
@@ -1,55 +1,154 @@
 """
 Rate Limiter Middleware - Redis-backed rate limiting
-Implements sliding window algorithm for accurate rate limiting
+Implements fixed window, approximate sliding window (default) and
+exact sliding window algorithms
 """
 
 import redis
-import time
+import threading
 from functools import wraps
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional
 from flask import request, jsonify, g
 import logging
 
 # Import from config
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-from config.settings import REDIS_URL, RATE_LIMIT_ENABLED, RATE_LIMITS
+from config.settings import REDIS_URL, RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_ALGORITHM
+from src.middleware.redis_pool import get_pool
 
 logger = logging.getLogger(__name__)
 
+# Rate limit scripts, executed atomically on the Redis server.
+# All share the same calling convention:
+#   KEYS[1] = rate limit key
+#   ARGV[1] = window (seconds), ARGV[2] = limit,
+#   ARGV[3] = hits to record (0 only reads the count)
+# Hits are recorded only if they fit under the limit.
+# Returns {count already in the window (before this one), server now,
+#          time the limit resets}.
+# Time comes from Redis TIME so every app instance shares one clock
+# (writes after TIME rely on effects replication, the default since Redis 5).
+
+# Fixed window: one counter per key that expires with the window.
+FIXED_WINDOW_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local window, limit, hits = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+if hits > 0 and count + hits <= limit then
+    if redis.call('INCRBY', KEYS[1], hits) == hits then
+        redis.call('EXPIRE', KEYS[1], window)
+    end
+end
+-- The counter resets when its key expires, not a full window from now
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < 0 then ttl = window end
+return {count, now, now + ttl}
+"""
+
+# Sliding window approximation: per-window counters in a hash; the previous
+# window's count is weighted by how much of it still overlaps the sliding window.
+SLIDING_WINDOW_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local window, limit, hits = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = math.floor(now / window)
+local curr = tonumber(redis.call('HGET', KEYS[1], bucket) or '0')
+local prev = tonumber(redis.call('HGET', KEYS[1], bucket - 1) or '0')
+local count = math.floor(prev * (1 - (now % window) / window) + curr)
+if hits > 0 and count + hits <= limit then
+    redis.call('HINCRBY', KEYS[1], bucket, hits)
+    redis.call('EXPIRE', KEYS[1], window * 2)
+    if redis.call('HLEN', KEYS[1]) > 2 then
+        for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+            if tonumber(field) < bucket - 1 then
+                redis.call('HDEL', KEYS[1], field)
+            end
+        end
+    end
+end
+-- The weighted count has no exact reset time; a full window is an upper bound
+return {count, now, now + window}
+"""
+
+# Exact sliding window: one sorted-set member per request (O(limit) memory).
+# Members are "<now>:<index>" so several hits within the same second stay distinct.
+SLIDING_PRECISE_LUA = """
+local now = tonumber(redis.call('TIME')[1])
+local window, limit, hits = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if hits > 0 and count + hits <= limit then
+    for i = count, count + hits - 1 do
+        redis.call('ZADD', KEYS[1], now, now .. ':' .. i)
+    end
+    redis.call('EXPIRE', KEYS[1], window + 1)
+end
+-- A slot frees up when the oldest request leaves the window
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')[2]
+local reset = oldest and tonumber(oldest) + window or now + window
+return {count, now, reset}
+"""
+
+# Limit passed by bulk_incr so the scripts never reject its hits
+# (2**53 is the largest integer a Lua number holds exactly)
+UNBOUNDED_LIMIT = 2 ** 53
+
+RATE_LIMIT_SCRIPTS = {
+    "fixed": FIXED_WINDOW_LUA,
+    "sliding": SLIDING_WINDOW_LUA,
+    "sliding_precise": SLIDING_PRECISE_LUA,
+}
+
+# Window length per period name used in RATE_LIMITS ("20/minute")
+RATE_LIMIT_PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
 
 class RateLimiter:
     """
-    Redis-backed rate limiter using sliding window algorithm
+    Redis-backed rate limiter (fixed window, sliding window or exact sliding window)
     """
 
-    def __init__(self, redis_url: str, enabled: bool = True):
+    def __init__(self, redis_url: str, enabled: bool = True, algorithm: str = "sliding"):
         """
         Initialize rate limiter
 
         Args:
             redis_url: Redis connection URL
             enabled: Whether rate limiting is enabled
+            algorithm: "fixed", "sliding" or "sliding_precise"
         """
+        if algorithm not in RATE_LIMIT_SCRIPTS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
         self.enabled = enabled
         self.redis_url = redis_url
+        self.algorithm = algorithm
+        self._script = RATE_LIMIT_SCRIPTS[algorithm]
         self._redis = None
-
-        if self.enabled:
-            try:
-                self._redis = redis.from_url(redis_url)
-                # Test connection
-                self._redis.ping()
-                logger.info(f"Rate limiter initialized successfully (Redis: {redis_url})")
-            except Exception as e:
-                logger.warning(f"Failed to connect to Redis, rate limiting disabled: {e}")
-                self.enabled = False
+        self._script_sha = None
+        self._init_lock = threading.Lock()
 
     @property
     def redis(self):
-        """Get Redis client"""
-        if not self.enabled or self._redis is None:
+        """Get Redis client, lazy initialization (connects on first use)"""
+        if self._redis is None and self.enabled:
+            with self._init_lock:
+                if self._redis is None and self.enabled:
+                    try:
+                        client = redis.Redis(connection_pool=get_pool(self.redis_url))
+                        # Test connection
+                        client.ping()
+                        # Register the rate limit script once; calls go through EVALSHA
+                        self._script_sha = client.script_load(self._script)
+                        self._redis = client
+                        logger.info(f"Rate limiter initialized successfully (Redis: {self.redis_url})")
+                    except Exception as e:
+                        logger.warning(f"Failed to connect to Redis, rate limiting disabled: {e}")
+                        self.enabled = False
+        if not self.enabled:
             return None
         return self._redis
 
@@ -60,42 +159,22 @@ class RateLimiter:
         window: int
     ) -> Tuple[bool, Dict[str, int]]:
         """
-        Check if request is within rate limit using sliding window
+        Check if request is within rate limit and record it if allowed
 
         Args:
-            key: Rate limit key (e.g., "ratelimit:query:user123")
+            key: Rate limit key (e.g., "ratelimit:sliding:query:user123")
             limit: Maximum number of requests allowed
             window: Time window in seconds
 
         Returns:
             Tuple of (allowed: bool, info: dict)
-            info contains: limit, remaining, reset
+            info contains: limit, remaining, reset, window, retry_after
         """
         if not self.enabled or self.redis is None:
             return True, {}
 
         try:
-            now = int(time.time())
-            window_start = now - window
-
-            # Use Redis pipeline for atomic operations
-            pipe = self.redis.pipeline()
-
-            # Remove old entries outside the window
-            pipe.zremrangebyscore(key, 0, window_start)
-
-            # Count current requests in window
-            pipe.zcard(key)
-
-            # Add current request timestamp
-            pipe.zadd(key, {now: now})
-
-            # Set expiry on the key
-            pipe.expire(key, window + 1)
-
-            # Execute pipeline
-            results = pipe.execute()
-            current_count = results[1]  # Result from zcard
+            current_count, now, reset = self._run_script(key, window, limit, 1)
 
             allowed = current_count < limit
             remaining = max(0, limit - current_count - 1) if allowed else 0
@@ -103,8 +182,11 @@ class RateLimiter:
             info = {
                 "limit": limit,
                 "remaining": remaining,
-                "reset": now + window,
+                "reset": reset,
                 "window": window,
+                # Seconds until the limit resets; both times come from the
+                # script, so this is the real wait, not always a full window
+                "retry_after": reset - now,
             }
 
             if not allowed:
@@ -117,6 +199,14 @@ class RateLimiter:
             # On error, allow the request (fail open)
             return True, {}
 
+    def _run_script(self, key: str, *args) -> List[int]:
+        """Run the rate limit script, reloading it if Redis lost the script cache"""
+        try:
+            return self.redis.evalsha(self._script_sha, 1, key, *args)
+        except redis.exceptions.NoScriptError:
+            # SCRIPT FLUSH or a server restart dropped the script; EVAL re-caches it
+            return self.redis.eval(self._script, 1, key, *args)
+
     def reset_limit(self, key: str):
         """
         Reset rate limit for a specific key
@@ -149,25 +239,40 @@ class RateLimiter:
             return limit
 
         try:
-            now = int(time.time())
-            window_start = now - window
-
-            # Clean old entries and count
-            pipe = self.redis.pipeline()
-            pipe.zremrangebyscore(key, 0, window_start)
-            pipe.zcard(key)
-            results = pipe.execute()
-
-            current_count = results[1]
+            # hits=0 only reads the current count
+            current_count, _, _ = self._run_script(key, window, limit, 0)
             return max(0, limit - current_count)
 
         except Exception as e:
             logger.error(f"Failed to get remaining for key '{key}': {e}")
             return limit
 
+    def bulk_incr(self, key: str, n: int, window: int) -> int:
+        """
+        Record n hits for a key in a single script call, ignoring the limit
+
+        Args:
+            key: Rate limit key
+            n: Number of hits to record
+            window: Time window in seconds
+
+        Returns:
+            Count in the window after recording the hits (0 if disabled)
+        """
+        if not self.enabled or self.redis is None:
+            return 0
+
+        try:
+            current_count, _, _ = self._run_script(key, window, UNBOUNDED_LIMIT, n)
+            return current_count + n
+
+        except Exception as e:
+            logger.error(f"Rate limit bulk increment error for key '{key}': {e}")
+            return 0
+
 
 # Global rate limiter instance
-rate_limiter = RateLimiter(REDIS_URL, enabled=RATE_LIMIT_ENABLED)
+rate_limiter = RateLimiter(REDIS_URL, enabled=RATE_LIMIT_ENABLED, algorithm=RATE_LIMIT_ALGORITHM)
 
 
 def rate_limit(limit_key: str = "default"):
@@ -183,8 +288,25 @@ def rate_limit(limit_key: str = "default"):
         def query():
             return {"result": "..."}
 
-    The rate limit is applied per user (from userId in request) or per IP address.
+    The rate limit is applied per user (X-User-Id header, userId query param or,
+    for legacy clients, userId in the JSON body) or per IP address.
     """
+    # Parse configuration once per decoration; a malformed value fails at import
+    limit_str = RATE_LIMITS.get(limit_key, "100/hour")
+    try:
+        count_str, period = limit_str.split("/")
+        limit_count = int(count_str)
+        window_seconds = RATE_LIMIT_PERIODS[period]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit config for '{limit_key}': {limit_str}")
+
+    # The algorithm is part of the key: each one stores a different Redis type,
+    # so switching RATE_LIMIT_ALGORITHM must not reuse (and WRONGTYPE on) old keys
+    key_prefix = f"ratelimit:{rate_limiter.algorithm}:{limit_key}:"
+    # Header values that don't change per request
+    limit_header = str(limit_count)
+    window_header = str(window_seconds)
+
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -192,36 +314,21 @@ def rate_limit(limit_key: str = "default"):
             if not rate_limiter.enabled:
                 return func(*args, **kwargs)
 
-            # Get rate limit configuration
-            limit_str = RATE_LIMITS.get(limit_key, "100/hour")
-            try:
-                limit_count, period = limit_str.split("/")
-                limit_count = int(limit_count)
-            except ValueError:
-                logger.error(f"Invalid rate limit config: {limit_str}")
-                return func(*args, **kwargs)
-
-            # Parse time window
-            window_seconds = {
-                "second": 1,
-                "minute": 60,
-                "hour": 3600,
-                "day": 86400,
-            }.get(period, 3600)
-
-            # Determine identifier (user_id or IP address)
-            identifier = None
-            if request.is_json:
-                identifier = request.json.get("userId")
-            elif request.args:
-                identifier = request.args.get("userId")
+            # Determine identifier (user_id or IP address); header and query string
+            # are free, the JSON body is only parsed as a fallback
+            identifier = request.headers.get("X-User-Id") or request.args.get("userId")
+            if not identifier and request.is_json:
+                # cache=True so the route handler reuses the parsed body
+                body = request.get_json(silent=True, cache=True)
+                if isinstance(body, dict):
+                    identifier = body.get("userId")
 
             # Fallback to IP address
             if not identifier:
                 identifier = request.remote_addr or "unknown"
 
             # Build rate limit key
-            rate_key = f"ratelimit:{limit_key}:{identifier}"
+            rate_key = key_prefix + str(identifier)
 
             # Check rate limit
             allowed, info = rate_limiter.check_limit(rate_key, limit_count, window_seconds)
@@ -236,7 +343,7 @@ def rate_limit(limit_key: str = "default"):
                     "message": f"Too many requests. Limit: {info['limit']} per {period}",
                     "limit": info['limit'],
                     "reset": info['reset'],
-                    "retry_after": info['reset'] - int(time.time()),
+                    "retry_after": info['retry_after'],
                 }
                 return jsonify(response_data), 429
 
@@ -250,11 +357,17 @@ def rate_limit(limit_key: str = "default"):
                 response, status_code = result, 200
 
             # Add headers if response is JSON (has headers attribute)
-            if hasattr(response, 'headers') and info:
-                response.headers['X-RateLimit-Limit'] = str(info['limit'])
-                response.headers['X-RateLimit-Remaining'] = str(info['remaining'])
-                response.headers['X-RateLimit-Reset'] = str(info['reset'])
-                response.headers['X-RateLimit-Window'] = str(info['window'])
+            try:
+                headers = response.headers
+            except AttributeError:
+                headers = None
+            if headers is not None and info:
+                headers.update({
+                    'X-RateLimit-Limit': limit_header,
+                    'X-RateLimit-Remaining': str(info['remaining']),
+                    'X-RateLimit-Reset': str(info['reset']),
+                    'X-RateLimit-Window': window_header,
+                })
 
             return response, status_code
 
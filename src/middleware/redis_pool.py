@@ -0,0 +1,38 @@
+"""
+Redis Connection Pool - shared by cache and rate limiter middleware
+Caps the number of sockets per process and reuses them across requests
+"""
+
+import redis
+from functools import lru_cache
+
+# Import from config
+from config.settings import REDIS_POOL_SIZE, REDIS_POOL_TIMEOUT
+
+
+@lru_cache(maxsize=None)
+def get_pool(redis_url: str) -> redis.BlockingConnectionPool:
+    """
+    Get the process-wide connection pool for a Redis URL
+
+    Replies are raw bytes; callers decode what they need. Creating a pool
+    does not open any connection.
+
+    Args:
+        redis_url: Redis connection URL
+
+    Returns:
+        Shared BlockingConnectionPool
+    """
+    return redis.BlockingConnectionPool.from_url(
+        redis_url,
+        max_connections=REDIS_POOL_SIZE,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_keepalive=True,
+    )
+
+
+# Export for convenience
+__all__ = [
+    'get_pool',
+]
@@ -6,228 +6,230 @@ Tests connection, operations, and Polars integration
 
 import sys
 import os
+import logging
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 sys.path.insert(0, os.path.dirname(__file__))
 
-def test_basic_connection():
-    """Test basic SQLAlchemy connection"""
-    print("\n[1/4] Testing Basic Connection...")
+import polars as pl
+from sqlalchemy import column, insert, table, text
+from sqlalchemy.exc import ProgrammingError
+from tests._helpers import get_engine, pg_url, run_test
+
+log = logging.getLogger(__name__)
+
+# SQLSTATE for "relation does not exist"
+UNDEFINED_TABLE = "42P01"
+INIT_DB_HINT = "run: psql -U convoinsight -d convoinsight -f scripts/init_db.sql"
+
+# Rows written through COPY and through executemany by the write test
+COPY_ROWS = 10_000
+EXECUTEMANY_ROWS = 1_000
+
+# Built once so SQLAlchemy compiles it once (compiled cache) for every execute.
+# A Core insert() (not text()) so executemany is batched by insertmanyvalues
+INSERT_STMT = insert(table("test_temp", column("message")))
+
+# Per-thread log buffers, so tests running in parallel don't interleave
+_output = threading.local()
+
+class _ThreadLocalStdout:
+    """stdout proxy that writes to the current thread's buffer, if it has one"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        return getattr(_output, "buffer", self._stream).write(text)
+
+    def flush(self):
+        getattr(_output, "buffer", self._stream).flush()
+
+def _run_buffered(name, test_func, engine):
+    """Run a test with its output captured; returns (passed, output)"""
+    _output.buffer = io.StringIO()
     try:
-        from sqlalchemy import create_engine, text
-        from config.settings import get_postgres_url
-
-        pg_url = get_postgres_url()
-        if not pg_url:
-            print("✗ No PostgreSQL URL configured")
-            print("  Set LOCAL_POSTGRES_URL or POSTGRES_URL in .env file")
-            return False
-
-        print(f"  Connecting to: {pg_url.split('@')[1] if '@' in pg_url else pg_url}")
-        engine = create_engine(pg_url)
-
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT 1 as test"))
-            assert result.scalar() == 1
-
-            # Get version
-            result = conn.execute(text("SELECT version()"))
-            version = result.scalar()
-            version_short = version.split(',')[0] if version else "Unknown"
-
-        print(f"✓ Basic connection works")
-        print(f"  {version_short}")
-        return True
-    except Exception as e:
-        print(f"✗ Basic connection failed: {e}")
-        print("\n  Troubleshooting:")
-        print("  1. Check if PostgreSQL is running: docker compose ps")
-        print("  2. Verify connection URL in .env file")
-        print("  3. Test connection: psql -U convoinsight -d convoinsight")
-        return False
-
-def test_sample_data():
+        return run_test(name, test_func, engine, report=log.info), _output.buffer.getvalue()
+    finally:
+        del _output.buffer
+
+def test_basic_connection(pg_engine):
+    """Test basic SQLAlchemy connection"""
+    log.info("\n[1/4] Testing Basic Connection...")
+    display_url = pg_engine.url.render_as_string(hide_password=True)
+    log.info(f"  Connecting to: {display_url.split('@')[1] if '@' in display_url else display_url}")
+
+    with pg_engine.connect() as conn:
+        result = conn.execute(text("SELECT 1 as test"))
+        assert result.scalar_one() == 1
+
+        # Get version
+        result = conn.execute(text("SELECT version()"))
+        version = result.scalar_one()
+        version_short = version.split(',')[0] if version else "Unknown"
+
+    log.info(f"✓ Basic connection works")
+    log.info(f"  {version_short}")
+
+def test_sample_data(pg_engine):
     """Test reading sample data"""
-    print("\n[2/4] Testing Sample Data...")
-    try:
-        from sqlalchemy import create_engine, text
-        from config.settings import get_postgres_url
-
-        pg_url = get_postgres_url()
-        engine = create_engine(pg_url)
-
-        with engine.connect() as conn:
-            # Check if table exists
-            result = conn.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables
-                    WHERE table_name = 'sample_data'
-                )
-            """))
-            table_exists = result.scalar()
-
-            if not table_exists:
-                print("⚠ Table 'sample_data' does not exist")
-                print("  Run: psql -U convoinsight -d convoinsight -f scripts/init_db.sql")
-                return False
-
-            # Count rows
-            result = conn.execute(text("SELECT COUNT(*) FROM sample_data"))
-            count = result.scalar()
-
-            if count >= 3:
-                print(f"✓ Sample data exists ({count} rows)")
-
-                # Show sample
-                result = conn.execute(text("SELECT * FROM sample_data LIMIT 3"))
-                rows = result.fetchall()
-                print("\n  Sample rows:")
-                for row in rows:
-                    print(f"    {dict(row._mapping)}")
-
-                return True
-            else:
-                print(f"⚠ Sample data incomplete ({count} rows, expected >= 3)")
-                print("  Run: psql -U convoinsight -d convoinsight -f scripts/init_db.sql")
-                return False
-    except Exception as e:
-        print(f"✗ Sample data test failed: {e}")
-        return False
-
-def test_polars_integration():
+    log.info("\n[2/4] Testing Sample Data...")
+    with pg_engine.connect() as conn:
+        # Row count and the first rows in one round-trip; a missing table
+        # surfaces as UndefinedTable instead of a separate existence check
+        try:
+            sample = conn.execute(text("""
+                WITH s AS (SELECT * FROM sample_data LIMIT 3)
+                SELECT
+                    (SELECT COUNT(*) FROM sample_data) AS cnt,
+                    (SELECT json_agg(s) FROM s) AS rows
+            """)).mappings().one()
+        except ProgrammingError as e:
+            if getattr(e.orig, "pgcode", None) != UNDEFINED_TABLE:
+                raise
+            sample = None
+
+    assert sample is not None, f"Table 'sample_data' does not exist ({INIT_DB_HINT})"
+    count = sample["cnt"]
+    assert count >= 3, f"Sample data incomplete ({count} rows, expected >= 3; {INIT_DB_HINT})"
+
+    log.info(f"✓ Sample data exists ({count} rows)")
+
+    # Show sample
+    log.info("\n  Sample rows:")
+    for row in sample["rows"]:
+        log.info(f"    {row}")
+
+def test_polars_integration(pg_engine):
     """Test Polars DataFrame integration"""
-    print("\n[3/4] Testing Polars Integration...")
-    try:
-        import polars as pl
-        from sqlalchemy import create_engine
-        from config.settings import get_postgres_url
-
-        pg_url = get_postgres_url()
-        engine = create_engine(pg_url)
-
-        with engine.connect() as conn:
-            # Read with Polars
-            try:
-                df = pl.read_database("SELECT * FROM sample_data", conn)
-                method = "Polars native"
-            except Exception as e:
-                # Fallback to pandas
-                import pandas as pd
-                pdf = pd.read_sql("SELECT * FROM sample_data", conn)
-                df = pl.from_pandas(pdf)
-                method = "Pandas fallback"
-
-            print(f"✓ Polars DataFrame created ({method})")
-            print(f"  Shape: {df.shape[0]} rows × {df.shape[1]} columns")
-            print(f"  Columns: {', '.join(df.columns)}")
-            print(f"\n  First row:")
-            print(f"    {df.row(0, named=True)}")
-
-        return True
-    except Exception as e:
-        print(f"✗ Polars integration failed: {e}")
-        return False
-
-def test_write_operation():
+    log.info("\n[3/4] Testing Polars Integration...")
+    # ConnectorX opens its own connection and reads straight into Arrow
+    df = pl.read_database_uri(
+        "SELECT * FROM sample_data",
+        pg_engine.url.render_as_string(hide_password=False),
+        engine="connectorx",
+    )
+    assert df.height > 0, "Polars read no rows from sample_data"
+
+    log.info(f"✓ Polars DataFrame created (ConnectorX)")
+    log.info(f"  Shape: {df.shape[0]} rows × {df.shape[1]} columns")
+    log.info(f"  Columns: {', '.join(df.columns)}")
+    log.info(f"\n  First row:")
+    log.info(f"    {df.row(0, named=True)}")
+
+def test_write_operation(pg_engine):
     """Test write operation"""
-    print("\n[4/4] Testing Write Operation...")
-    try:
-        from sqlalchemy import create_engine, text
-        from config.settings import get_postgres_url
-        import time
-
-        pg_url = get_postgres_url()
-        engine = create_engine(pg_url)
-
-        with engine.connect() as conn:
-            # Create test table
-            conn.execute(text("""
-                DROP TABLE IF EXISTS test_temp
-            """))
-            conn.execute(text("""
-                CREATE TABLE test_temp (
-                    id SERIAL PRIMARY KEY,
-                    message TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            conn.commit()
-
-            # Insert data
-            test_message = f"Test from Python at {time.time()}"
-            conn.execute(text("""
-                INSERT INTO test_temp (message) VALUES (:msg)
-            """), {"msg": test_message})
-            conn.commit()
-
-            # Read back
-            result = conn.execute(text("SELECT message FROM test_temp LIMIT 1"))
-            message = result.scalar()
-
-            # Cleanup
-            conn.execute(text("DROP TABLE test_temp"))
-            conn.commit()
-
-            if message == test_message:
-                print("✓ Write operation successful")
-                print(f"  Created table, inserted data, and cleaned up")
-                return True
-            else:
-                print("✗ Write operation failed: data mismatch")
-                return False
-
-    except Exception as e:
-        print(f"✗ Write operation failed: {e}")
-        # Try to cleanup if table exists
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("DROP TABLE IF EXISTS test_temp"))
-                conn.commit()
-        except:
-            pass
-        return False
+    log.info("\n[4/4] Testing Write Operation...")
+    # One transaction: the temp table has to outlive the INSERT for the
+    # COPY and the count, and ON COMMIT DROP removes it at the end
+    with pg_engine.begin() as conn:
+        # Create, insert and read back in one round-trip
+        test_message = f"Test from Python at {time.time()}"
+        result = conn.exec_driver_sql("""
+            CREATE TEMP TABLE test_temp (
+                id SERIAL PRIMARY KEY,
+                message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ON COMMIT DROP;
+            INSERT INTO test_temp (message) VALUES (%s) RETURNING message
+        """, (test_message,))
+        assert result.scalar_one() == test_message, "Write operation data mismatch"
+
+        # Bulk path: stream rows with COPY instead of one INSERT per row
+        rows = io.StringIO("".join(f"row {i}\n" for i in range(COPY_ROWS)))
+        started = time.perf_counter()
+        with conn.connection.driver_connection.cursor() as cursor:
+            cursor.copy_expert("COPY test_temp (message) FROM STDIN", rows)
+        elapsed = time.perf_counter() - started
+
+        # Parameterized path: one statement, many parameter sets, sent as
+        # multi-row INSERTs by SQLAlchemy's insertmanyvalues
+        started = time.perf_counter()
+        conn.execute(INSERT_STMT, [{"message": f"batch {i}"} for i in range(EXECUTEMANY_ROWS)])
+        elapsed_many = time.perf_counter() - started
+
+        expected = 1 + COPY_ROWS + EXECUTEMANY_ROWS
+        count = conn.exec_driver_sql("SELECT COUNT(*) FROM test_temp").scalar_one()
+        assert count == expected, f"Bulk write: expected {expected} rows, got {count}"
+
+    log.info("✓ Write operation successful")
+    log.info(f"  Created table, inserted data, and cleaned up")
+    log.info(f"  COPY wrote {COPY_ROWS} rows in {elapsed * 1000:.1f} ms "
+             f"({COPY_ROWS / elapsed:,.0f} rows/s)")
+    log.info(f"  Multi-row INSERT (insertmanyvalues) wrote {EXECUTEMANY_ROWS} rows in {elapsed_many * 1000:.1f} ms "
+             f"({EXECUTEMANY_ROWS / elapsed_many:,.0f} rows/s)")
 
 def main():
-    print("="*60)
-    print("PostgreSQL Setup Verification")
-    print("="*60)
+    log.info("="*60)
+    log.info("PostgreSQL Setup Verification")
+    log.info("="*60)
+
+    if not pg_url():
+        log.info("✗ No PostgreSQL URL configured")
+        log.info("  Set LOCAL_POSTGRES_URL or POSTGRES_URL in .env file")
+        return 1
 
-    tests = [
+    engine = get_engine()
+
+    # Read-only tests are independent and run in parallel on the shared pool
+    parallel_tests = [
         ("Basic Connection", test_basic_connection),
         ("Sample Data", test_sample_data),
         ("Polars Integration", test_polars_integration),
+    ]
+    # Tests that write run afterwards, one at a time
+    serial_tests = [
         ("Write Operation", test_write_operation),
     ]
 
     results = []
-    for name, test_func in tests:
-        result = test_func()
-        results.append((name, result))
-
-    print("\n" + "="*60)
-    print("Test Summary")
-    print("="*60)
+    with ThreadPoolExecutor(max_workers=len(parallel_tests)) as executor:
+        futures = [
+            (name, executor.submit(_run_buffered, name, test_func, engine))
+            for name, test_func in parallel_tests
+        ]
+        # Report in submission order so the output reads the same every run
+        for name, future in futures:
+            result, output = future.result()
+            sys.stdout.write(output)
+            results.append((name, result))
+
+    for name, test_func in serial_tests:
+        results.append((name, run_test(name, test_func, engine, report=log.info)))
+
+    log.info("\n" + "="*60)
+    log.info("Test Summary")
+    log.info("="*60)
 
     passed = sum(1 for _, result in results if result)
     total = len(results)
 
     for name, result in results:
         status = "✓ PASS" if result else "✗ FAIL"
-        print(f"{status}: {name}")
+        log.info(f"{status}: {name}")
 
-    print(f"\nTotal: {passed}/{total} tests passed")
+    log.info(f"\nTotal: {passed}/{total} tests passed")
 
     if passed == total:
-        print("\n🎉 All tests passed! PostgreSQL is ready to use.")
-        print("\nNext steps:")
-        print("  1. Run: python tests/test_middleware_basic.py")
-        print("  2. Continue to Phase 2: Prompt Externalization")
+        log.info("\n🎉 All tests passed! PostgreSQL is ready to use.")
+        log.info("\nNext steps:")
+        log.info("  1. Run: python tests/test_middleware_basic.py")
+        log.info("  2. Continue to Phase 2: Prompt Externalization")
         return 0
     else:
-        print(f"\n⚠️  {total - passed} test(s) failed.")
-        print("\nTroubleshooting:")
-        print("  1. Check POSTGRES_SETUP_GUIDE.md for detailed setup")
-        print("  2. Verify PostgreSQL is running: docker compose ps")
-        print("  3. Check .env file configuration")
+        log.info(f"\n⚠️  {total - passed} test(s) failed.")
+        log.info("\nTroubleshooting:")
+        log.info("  1. Check POSTGRES_SETUP_GUIDE.md for detailed setup")
+        log.info("  2. Verify PostgreSQL is running: docker compose ps")
+        log.info("  3. Check .env file configuration")
+        log.info("  4. Test connection: psql -U convoinsight -d convoinsight")
         return 1
 
 if __name__ == "__main__":
+    # Log lines go through the thread-local proxy so parallel tests stay grouped
+    logging.basicConfig(
+        level=logging.INFO, format="%(message)s", stream=_ThreadLocalStdout(sys.stdout)
+    )
     sys.exit(main())
@@ -6,146 +6,139 @@ Simple script to verify Redis connectivity and basic operations
 
 import sys
 import os
+import logging
 sys.path.insert(0, os.path.dirname(__file__))
 
-def test_connection():
-    print("Testing Redis connection...")
-    print("-" * 60)
+import redis
+from config.settings import REDIS_URL
+from tests._helpers import get_redis
+
+log = logging.getLogger(__name__)
+
+def test_connection(redis_client):
+    log.info("Testing Redis connection...")
+    log.info("-" * 60)
+
+    # Mask password in output
+    display_url = REDIS_URL
+    if '@' in display_url and ':' in display_url.split('@')[0]:
+        parts = display_url.split('@')
+        user_pass = parts[0].split('://')[-1]
+        user = user_pass.split(':')[0] if ':' in user_pass else user_pass
+        display_url = display_url.replace(user_pass, f"{user}:***")
+
+    log.info(f"Connecting to: {display_url}")
+    log.info("")
+
+    test_key = "test:connection:check"
+    test_value = "Hello from Redis test!"
+
+    # Queue every check and send them in a single round-trip
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.ping()
+    pipe.info()
+    pipe.info('keyspace')
+    pipe.set(test_key, test_value, ex=10)  # Expires in 10 seconds
+    pipe.get(test_key)
+    pipe.ttl(test_key)
+    pipe.delete(test_key)
+    pong, info, db_info, _, retrieved, ttl, _ = pipe.execute()
+
+    # Test PING
+    assert pong, "PING failed"
+    log.info("✓ Connection successful!")
+
+    log.info("")
+    log.info(f"Redis Version: {info.get('redis_version', 'Unknown')}")
+    log.info(f"Mode: {info.get('redis_mode', 'Unknown')}")
+    log.info(f"OS: {info.get('os', 'Unknown')}")
+    log.info(f"Uptime: {info.get('uptime_in_seconds', 0)} seconds")
+    log.info("")
+
+    # Memory info
+    memory_used = info.get('used_memory_human', 'Unknown')
+    memory_peak = info.get('used_memory_peak_human', 'Unknown')
+    log.info(f"Memory Used: {memory_used}")
+    log.info(f"Memory Peak: {memory_peak}")
+    log.info("")
+
+    # Connected clients
+    clients = info.get('connected_clients', 0)
+    log.info(f"Connected Clients: {clients}")
+    log.info("")
+
+    # Database info
+    if db_info:
+        log.info("Database Info:")
+        for db, stats in db_info.items():
+            if db.startswith('db'):
+                log.info(f"  {db}: {stats}")
+    else:
+        log.info("Database: Empty (no keys)")
+
+    log.info("")
+
+    # Test basic operations
+    log.info("Testing basic operations...")
+
+    # SET
+    log.info(f"  SET {test_key} = \"{test_value}\" (TTL: 10s)")
+
+    # GET
+    assert retrieved == test_value, f"GET failed: expected '{test_value}', got '{retrieved}'"
+    log.info(f"  GET {test_key} = \"{retrieved}\" ✓")
+
+    # TTL
+    log.info(f"  TTL {test_key} = {ttl} seconds")
+
+    # DELETE
+    log.info(f"  DEL {test_key} ✓")
+
+    log.info("")
+    log.info("-" * 60)
+    log.info("✓ Redis is ready to use!")
+    log.info("")
+    log.info("Features enabled:")
+    log.info("  - Caching: Fast dataset & query result storage")
+    log.info("  - Rate Limiting: Per-user request throttling")
+    log.info("  - Session Storage: Fast session state management")
+    log.info("")
+    log.info("Next: Test middleware integration")
+    log.info("  python tests/test_middleware_basic.py")
+
+def main():
+    if not REDIS_URL:
+        log.info("✗ No Redis URL configured")
+        log.info("\nPlease set REDIS_URL in your .env file:")
+        log.info("  REDIS_URL=redis://localhost:6379/0")
+        return 1
 
     try:
-        import redis
-        from config.settings import REDIS_URL
-
-        if not REDIS_URL:
-            print("✗ No Redis URL configured")
-            print("\nPlease set REDIS_URL in your .env file:")
-            print("  REDIS_URL=redis://localhost:6379/0")
-            return False
-
-        # Mask password in output
-        display_url = REDIS_URL
-        if '@' in display_url and ':' in display_url.split('@')[0]:
-            parts = display_url.split('@')
-            user_pass = parts[0].split('://')[-1]
-            user = user_pass.split(':')[0] if ':' in user_pass else user_pass
-            display_url = display_url.replace(user_pass, f"{user}:***")
-
-        print(f"Connecting to: {display_url}")
-        print()
-
-        # Create Redis client
-        r = redis.from_url(REDIS_URL, decode_responses=True)
-
-        # Test PING
-        if r.ping():
-            print("✓ Connection successful!")
-        else:
-            print("✗ PING failed")
-            return False
-
-        # Get Redis info
-        info = r.info()
-
-        print()
-        print(f"Redis Version: {info.get('redis_version', 'Unknown')}")
-        print(f"Mode: {info.get('redis_mode', 'Unknown')}")
-        print(f"OS: {info.get('os', 'Unknown')}")
-        print(f"Uptime: {info.get('uptime_in_seconds', 0)} seconds")
-        print()
-
-        # Memory info
-        memory_used = info.get('used_memory_human', 'Unknown')
-        memory_peak = info.get('used_memory_peak_human', 'Unknown')
-        print(f"Memory Used: {memory_used}")
-        print(f"Memory Peak: {memory_peak}")
-        print()
-
-        # Connected clients
-        clients = info.get('connected_clients', 0)
-        print(f"Connected Clients: {clients}")
-        print()
-
-        # Database info
-        db_info = r.info('keyspace')
-        if db_info:
-            print("Database Info:")
-            for db, stats in db_info.items():
-                if db.startswith('db'):
-                    print(f"  {db}: {stats}")
-        else:
-            print("Database: Empty (no keys)")
-
-        print()
-
-        # Test basic operations
-        print("Testing basic operations...")
-        test_key = "test:connection:check"
-        test_value = "Hello from Redis test!"
-
-        # SET
-        r.set(test_key, test_value, ex=10)  # Expires in 10 seconds
-        print(f"  SET {test_key} = \"{test_value}\" (TTL: 10s)")
-
-        # GET
-        retrieved = r.get(test_key)
-        if retrieved == test_value:
-            print(f"  GET {test_key} = \"{retrieved}\" ✓")
-        else:
-            print(f"  GET failed: expected '{test_value}', got '{retrieved}' ✗")
-            return False
-
-        # TTL
-        ttl = r.ttl(test_key)
-        print(f"  TTL {test_key} = {ttl} seconds")
-
-        # DELETE
-        r.delete(test_key)
-        print(f"  DEL {test_key} ✓")
-
-        print()
-        print("-" * 60)
-        print("✓ Redis is ready to use!")
-        print()
-        print("Features enabled:")
-        print("  - Caching: Fast dataset & query result storage")
-        print("  - Rate Limiting: Per-user request throttling")
-        print("  - Session Storage: Fast session state management")
-        print()
-        print("Next: Test middleware integration")
-        print("  python tests/test_middleware_basic.py")
-
-        return True
-
-    except ImportError as e:
-        print(f"✗ Missing dependency: {e}")
-        print("\nPlease install required packages:")
-        print("  pip install -r requirements.txt")
-        return False
-
+        test_connection(get_redis())
     except redis.ConnectionError as e:
-        print(f"✗ Connection failed: {e}")
-        print()
-        print("Troubleshooting:")
-        print("  1. Check if Redis is running:")
-        print("     - Docker: docker compose ps")
-        print("     - Native: redis-cli ping")
-        print()
-        print("  2. Verify connection URL in .env file:")
-        print("     REDIS_URL=redis://localhost:6379/0")
-        print()
-        print("  3. Start Redis:")
-        print("     - Docker: docker compose up -d")
-        print("     - Native: brew services start redis (macOS)")
-        print("               sudo systemctl start redis-server (Linux)")
-        print()
-        print("  4. See REDIS_SETUP_GUIDE.md for detailed setup instructions")
-        return False
-
+        log.info(f"✗ Connection failed: {e}")
+        log.info("")
+        log.info("Troubleshooting:")
+        log.info("  1. Check if Redis is running:")
+        log.info("     - Docker: docker compose ps")
+        log.info("     - Native: redis-cli ping")
+        log.info("")
+        log.info("  2. Verify connection URL in .env file:")
+        log.info("     REDIS_URL=redis://localhost:6379/0")
+        log.info("")
+        log.info("  3. Start Redis:")
+        log.info("     - Docker: docker compose up -d")
+        log.info("     - Native: brew services start redis (macOS)")
+        log.info("               sudo systemctl start redis-server (Linux)")
+        log.info("")
+        log.info("  4. See REDIS_SETUP_GUIDE.md for detailed setup instructions")
+        return 1
     except Exception as e:
-        print(f"✗ Unexpected error: {e}")
-        print("\nCheck REDIS_SETUP_GUIDE.md for troubleshooting")
-        return False
+        log.info(f"✗ Unexpected error: {e}")
+        log.info("\nCheck REDIS_SETUP_GUIDE.md for troubleshooting")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    success = test_connection()
-    sys.exit(0 if success else 1)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Shared connection helpers for the setup scripts and pytest fixtures
+Each helper builds its client once per process so every test reuses it
+"""
+
+from functools import lru_cache
+from unittest import SkipTest
+
+
+@lru_cache(maxsize=1)
+def pg_url():
+    """PostgreSQL URL for the current deployment mode, resolved once"""
+    from config.settings import get_postgres_url
+
+    return get_postgres_url()
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Shared SQLAlchemy engine, so each test checks out from a warm pool"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+
+    return create_engine(
+        pg_url(),
+        poolclass=QueuePool,
+        # Keep pre-ping off: it adds a SELECT 1 round-trip per checkout and,
+        # behind PgBouncer in transaction mode, leaves "idle in transaction"
+        # server connections. pool_recycle handles stale connections instead.
+        pool_pre_ping=False,
+        pool_size=5,
+        max_overflow=2,
+        pool_recycle=60,
+        pool_timeout=30,
+        # Fail fast when the server is unreachable instead of hanging the checks
+        connect_args={"connect_timeout": 5},
+        future=True,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_redis():
+    """Shared Redis client with decoded (str) responses, connected up front"""
+    import redis
+    from config.settings import REDIS_URL
+
+    # The setup checks pipeline everything, so one connection is enough
+    pool = redis.ConnectionPool.from_url(
+        REDIS_URL,
+        decode_responses=True,
+        socket_keepalive=True,
+        max_connections=1,
+    )
+    # Pay TCP + AUTH now and hand the warm connection back to the pool;
+    # if Redis is down, the first real command reports it instead
+    try:
+        pool.release(pool.get_connection("PING"))
+    except redis.ConnectionError:
+        pass
+    return redis.Redis(connection_pool=pool)
+
+
+def run_test(name, test_func, *args, report=print):
+    """
+    Run one test outside pytest and return whether it passed
+    Skipped tests count as passed; failures are reported, not raised
+    """
+    try:
+        test_func(*args)
+    except SkipTest as e:
+        report(f"⊘ {name} skipped: {e}")
+    except Exception as e:
+        report(f"✗ {name} failed: {e}")
+        return False
+    return True
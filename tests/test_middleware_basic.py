@@ -5,154 +5,297 @@ Run these tests to verify middleware functionality
 
 import sys
 import os
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import SkipTest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from tests._helpers import run_test
+
 def test_cache_import():
     """Test that cache module can be imported"""
-    try:
-        from src.middleware.cache import cache_manager, cached
-        print("✓ Cache module imported successfully")
-        print(f"  - Cache enabled: {cache_manager.enabled}")
-        print(f"  - Redis URL: {cache_manager.redis_url}")
-        return True
-    except Exception as e:
-        print(f"✗ Failed to import cache module: {e}")
-        return False
+    from src.middleware.cache import cache_manager, cached
+    print("✓ Cache module imported successfully")
+    print(f"  - Cache enabled: {cache_manager.enabled}")
+    print(f"  - Redis URL: {cache_manager.redis_url}")
 
 
 def test_rate_limiter_import():
     """Test that rate limiter module can be imported"""
-    try:
-        from src.middleware.rate_limiter import rate_limiter, rate_limit
-        print("✓ Rate limiter module imported successfully")
-        print(f"  - Rate limiter enabled: {rate_limiter.enabled}")
-        print(f"  - Redis URL: {rate_limiter.redis_url}")
-        return True
-    except Exception as e:
-        print(f"✗ Failed to import rate limiter module: {e}")
-        return False
+    from src.middleware.rate_limiter import rate_limiter, rate_limit
+    print("✓ Rate limiter module imported successfully")
+    print(f"  - Rate limiter enabled: {rate_limiter.enabled}")
+    print(f"  - Redis URL: {rate_limiter.redis_url}")
+
+
+def test_cache_key_normalization():
+    """Test that cache keys tell argument types apart and ignore dict order"""
+    from src.middleware.cache import cache_key
+
+    assert cache_key([1, 2]) != cache_key("[1, 2]"), "list hashed like its repr string"
+    assert cache_key(1) != cache_key("1"), "int hashed like str"
+    assert cache_key({"a": 1, "b": 2}) == cache_key({"b": 2, "a": 1}), "dict key order changed the key"
+    assert cache_key(a=1, b=2) == cache_key(b=2, a=1), "kwarg order changed the key"
+    assert cache_key(2 ** 64) != cache_key(str(2 ** 64)), "int beyond 64 bits hashed like str"
+    assert cache_key(float("nan")) != cache_key(None), "nan hashed like None"
+    print("✓ Cache keys distinguish argument types and ignore dict order")
 
 
 def test_cache_operations():
     """Test basic cache operations (if Redis is available)"""
-    try:
-        from src.middleware.cache import cache_manager
-
-        if not cache_manager.enabled:
-            print("⊘ Cache is disabled, skipping operations test")
-            return True
+    from src.middleware.cache import cache_manager
 
-        # Test set and get
-        test_key = "test:basic"
-        test_value = {"message": "Hello from cache test"}
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
 
-        cache_manager.set(test_key, test_value, ttl=10)
-        retrieved = cache_manager.get(test_key)
+    # Test set and get
+    test_key = "test:basic"
+    test_value = {"message": "Hello from cache test"}
 
-        if retrieved == test_value:
-            print("✓ Cache set/get operations work correctly")
-            # Clean up
-            cache_manager.delete(test_key)
-            return True
-        else:
-            print(f"✗ Cache value mismatch: expected {test_value}, got {retrieved}")
-            return False
+    cache_manager.set(test_key, test_value, ttl=10)
+    retrieved = cache_manager.get(test_key)
+    # Clean up
+    cache_manager.delete(test_key)
 
-    except Exception as e:
-        print(f"✗ Cache operations test failed: {e}")
-        return False
+    assert retrieved == test_value, f"Cache value mismatch: expected {test_value}, got {retrieved}"
+    print("✓ Cache set/get operations work correctly")
 
 
 def test_cached_decorator():
     """Test @cached decorator functionality"""
-    try:
-        from src.middleware.cache import cached
-        import time
-
-        call_count = 0
-
-        @cached("test:decorator", ttl=5)
-        def expensive_function(x):
-            nonlocal call_count
-            call_count += 1
-            return x * 2
-
-        # First call - should execute function
-        result1 = expensive_function(5)
-        count_after_first = call_count
-
-        # Second call - should use cache
-        result2 = expensive_function(5)
-        count_after_second = call_count
-
-        if result1 == result2 == 10:
-            if count_after_second == count_after_first:
-                print("✓ @cached decorator works correctly (cache hit)")
-                return True
-            else:
-                print("⊘ @cached decorator executed function on second call (cache miss or disabled)")
-                return True
-        else:
-            print(f"✗ @cached decorator result mismatch")
-            return False
-
-    except Exception as e:
-        print(f"✗ @cached decorator test failed: {e}")
-        return False
+    from src.middleware.cache import cached
+
+    call_count = 0
+
+    @cached("test:decorator", ttl=5)
+    def expensive_function(x):
+        nonlocal call_count
+        call_count += 1
+        return x * 2
+
+    # First call - should execute function
+    result1 = expensive_function(5)
+    count_after_first = call_count
+
+    # Second call - should use cache
+    result2 = expensive_function(5)
+    count_after_second = call_count
+
+    assert result1 == result2 == 10, "@cached decorator result mismatch"
+    if count_after_second == count_after_first:
+        print("✓ @cached decorator works correctly (cache hit)")
+    else:
+        print("⊘ @cached decorator executed function on second call (cache miss or disabled)")
+
+
+def test_cache_l1_tier():
+    """Test that hot keys are served from the in-process L1 without Redis"""
+    from src.middleware.cache import cache_manager
+    from config.settings import CACHE_L1_TTL
+
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
+    if CACHE_L1_TTL <= 0:
+        raise SkipTest("L1 cache is disabled")
+
+    test_key = "test:l1"
+    test_value = {"message": "Hello from L1"}
+
+    cache_manager.set(test_key, test_value, ttl=max(CACHE_L1_TTL, 10))
+    # Remove the key behind the manager's back; only L1 can still serve it
+    cache_manager.redis.delete(test_key)
+    retrieved = cache_manager.get(test_key)
+    cache_manager.delete(test_key)
+
+    assert retrieved == test_value, f"Expected L1 hit, got {retrieved}"
+    print("✓ Second read served from the L1 cache")
+
+
+def test_cache_l1_respects_redis_ttl():
+    """Test that an L1 entry filled on read expires with the Redis key"""
+    from src.middleware.cache import cache_manager
+    import time
+
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
+
+    test_key = "test:l1:short"
+    cache_manager.set(test_key, "short-lived", ttl=1)
+    first = cache_manager.get(test_key)
+    time.sleep(1.2)
+    second = cache_manager.get(test_key)
+
+    assert first == "short-lived" and second is None, \
+        f"Expected 'short-lived' then None, got {first!r} then {second!r}"
+    print("✓ L1 entry expired together with the Redis key")
+
+
+def test_cache_write_order():
+    """Test that a synchronous set is not overwritten by an older queued one"""
+    from src.middleware.cache import CacheManager, cache_manager
+
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
+
+    manager = CacheManager(cache_manager.redis_url, write_behind=True)
+    test_key = "test:write-order"
+
+    manager.set(test_key, "old", ttl=300)  # queued for the writer thread
+    manager.set(test_key, "new", ttl=1)    # shorter than the L1 TTL: written now
+    manager._flush()
+    # Read through a manager without L1 so the value comes from Redis
+    stored = CacheManager(cache_manager.redis_url, l1_ttl=0).get(test_key)
+    manager.delete(test_key)
+
+    assert stored == "new", f"Expected the newer value in Redis, got {stored!r}"
+    print("✓ Newer synchronous write survived the queued one")
+
+
+def test_cache_write_queue_full():
+    """Test that a full write-behind queue doesn't make set() wait for the writer"""
+    from src.middleware.cache import CacheManager, cache_manager
+    import queue
+    import threading
+    import time
+
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
+
+    manager = CacheManager(cache_manager.redis_url, write_behind=True)
+    test_key = "test:write-queue-full"
+
+    # A writer that never drains and a queue already full of another key
+    stalled = threading.Event()
+    manager._writer = threading.Thread(target=stalled.wait, daemon=True)
+    manager._writer.start()
+    manager._write_q = queue.Queue(maxsize=1)
+    manager._write_q.put(("test:other", 300, b"", None))
+
+    started = time.monotonic()
+    manager.set(test_key, "value", ttl=300)
+    elapsed = time.monotonic() - started
+    stalled.set()
+    stored = CacheManager(cache_manager.redis_url, l1_ttl=0).get(test_key)
+    cache_manager.redis.delete(test_key)
+
+    assert stored == "value" and elapsed < 1, \
+        f"Expected an immediate write, got {stored!r} after {elapsed:.2f}s"
+    print(f"✓ set() wrote synchronously in {elapsed * 1000:.1f} ms with the queue full")
+
+
+def test_cache_tag_invalidation():
+    """Test tag-based invalidation of @cached results"""
+    from src.middleware.cache import cache_manager, cached, invalidate_tag
+
+    # Accessing .redis connects lazily and disables the cache if Redis is down
+    if cache_manager.redis is None:
+        raise SkipTest("Cache is disabled")
+
+    call_count = 0
+
+    @cached("test:tagged", ttl=30, tags=["test-tag"])
+    def tagged_function(x):
+        nonlocal call_count
+        call_count += 1
+        return x + 1
+
+    tagged_function(1)
+    tagged_function(1)
+    invalidate_tag("test-tag")
+    tagged_function(1)
+    invalidate_tag("test-tag")
+
+    assert call_count == 2, f"Expected 2 calls after tag invalidation, got {call_count}"
+    print("✓ invalidate_tag evicted tagged entries")
 
 
 def test_rate_limiter_check():
     """Test rate limiter check functionality (if Redis is available)"""
-    try:
-        from src.middleware.rate_limiter import rate_limiter
-
-        if not rate_limiter.enabled:
-            print("⊘ Rate limiter is disabled, skipping check test")
-            return True
-
-        test_key = "test:ratelimit:user123"
-
-        # Should allow first 3 requests
-        for i in range(3):
-            allowed, info = rate_limiter.check_limit(test_key, limit=3, window=60)
-            if not allowed:
-                print(f"✗ Request {i+1}/3 was blocked unexpectedly")
-                return False
-
-        # 4th request should be blocked
-        allowed, info = rate_limiter.check_limit(test_key, limit=3, window=60)
-        if not allowed:
-            print("✓ Rate limiter correctly blocks after limit exceeded")
-            print(f"  - Limit: {info.get('limit')}, Remaining: {info.get('remaining')}")
-            # Clean up
-            rate_limiter.reset_limit(test_key)
-            return True
-        else:
-            print("✗ Rate limiter should have blocked 4th request")
-            return False
-
-    except Exception as e:
-        print(f"✗ Rate limiter check test failed: {e}")
-        return False
+    from src.middleware.rate_limiter import rate_limiter
+
+    if rate_limiter.redis is None:
+        raise SkipTest("Rate limiter is disabled")
+
+    test_key = "test:ratelimit:user123"
+
+    # Record the first 3 requests in one round-trip
+    count = rate_limiter.bulk_incr(test_key, 3, 60)
+    # 4th request should be blocked
+    allowed, info = rate_limiter.check_limit(test_key, limit=3, window=60)
+    # Clean up
+    rate_limiter.reset_limit(test_key)
+
+    assert count == 3, f"Expected 3 recorded requests, got {count}"
+    assert not allowed, "Rate limiter should have blocked 4th request"
+    print("✓ Rate limiter correctly blocks after limit exceeded")
+    print(f"  - Limit: {info.get('limit')}, Remaining: {info.get('remaining')}")
+
+
+def test_rate_limiter_algorithms():
+    """Smoke test every rate limit algorithm's script (if Redis is available)"""
+    from src.middleware.rate_limiter import RateLimiter, RATE_LIMIT_SCRIPTS, rate_limiter
+
+    if rate_limiter.redis is None:
+        raise SkipTest("Rate limiter is disabled")
+
+    for algorithm in RATE_LIMIT_SCRIPTS:
+        limiter = RateLimiter(rate_limiter.redis_url, algorithm=algorithm)
+        test_key = f"test:ratelimit:{algorithm}:user123"
+        limiter.reset_limit(test_key)
+
+        allowed = [limiter.check_limit(test_key, limit=2, window=60)[0] for _ in range(2)]
+        max_retry_after = 60
+        if algorithm == "fixed":
+            # Late in the window the reset follows the counter's expiry
+            limiter.redis.expire(test_key, 5)
+            max_retry_after = 5
+        blocked, info = limiter.check_limit(test_key, limit=2, window=60)
+        allowed.append(blocked)
+        remaining = limiter.get_remaining(test_key, limit=2, window=60)
+        limiter.reset_limit(test_key)
+
+        assert allowed == [True, True, False] and remaining == 0, (
+            f"{algorithm}: expected [True, True, False] with 0 remaining, "
+            f"got {allowed} with {remaining} remaining"
+        )
+        assert 0 < info["retry_after"] <= max_retry_after, (
+            f"{algorithm}: expected retry_after within {max_retry_after}s, "
+            f"got {info['retry_after']}"
+        )
+        print(f"✓ {algorithm} allows 2 requests and blocks the 3rd")
 
 
 def test_config_loading():
     """Test that config loads correctly"""
-    try:
-        from config import settings
-        print("✓ Config module loaded successfully")
-        print(f"  - Deployment mode: {settings.MODE}")
-        print(f"  - Cache enabled: {settings.CACHE_ENABLED}")
-        print(f"  - Rate limit enabled: {settings.RATE_LIMIT_ENABLED}")
-        print(f"  - Features: {settings.FEATURES}")
-        return True
-    except Exception as e:
-        print(f"✗ Config loading failed: {e}")
-        return False
+    from config import settings
+    print("✓ Config module loaded successfully")
+    print(f"  - Deployment mode: {settings.MODE}")
+    print(f"  - Cache enabled: {settings.CACHE_ENABLED}")
+    print(f"  - Rate limit enabled: {settings.RATE_LIMIT_ENABLED}")
+    print(f"  - Features: {settings.FEATURES}")
+
+
+# Modules imported by the tests, preloaded together before the run
+PRELOAD_MODULES = [
+    "src.middleware.cache",
+    "src.middleware.rate_limiter",
+    "config.settings",
+]
 
 
 def run_all_tests():
     """Run all middleware tests"""
+    # Import the heavy modules concurrently; each test's import then hits sys.modules.
+    # Failures are left for the import tests to report.
+    with ThreadPoolExecutor(max_workers=len(PRELOAD_MODULES)) as executor:
+        for module_name in PRELOAD_MODULES:
+            executor.submit(importlib.import_module, module_name)
+
     print("\n" + "="*60)
     print("ConvoInsight Middleware Tests")
     print("="*60 + "\n")
@@ -161,16 +304,22 @@ def run_all_tests():
         ("Config Loading", test_config_loading),
         ("Cache Import", test_cache_import),
         ("Rate Limiter Import", test_rate_limiter_import),
+        ("Cache Key Normalization", test_cache_key_normalization),
         ("Cache Operations", test_cache_operations),
         ("@cached Decorator", test_cached_decorator),
+        ("Cache L1 Tier", test_cache_l1_tier),
+        ("Cache L1 Expiry", test_cache_l1_respects_redis_ttl),
+        ("Cache Write Order", test_cache_write_order),
+        ("Cache Write Queue Full", test_cache_write_queue_full),
+        ("Cache Tag Invalidation", test_cache_tag_invalidation),
         ("Rate Limiter Check", test_rate_limiter_check),
+        ("Rate Limiter Algorithms", test_rate_limiter_algorithms),
     ]
 
     results = []
     for test_name, test_func in tests:
         print(f"\n[{test_name}]")
-        result = test_func()
-        results.append((test_name, result))
+        results.append((test_name, run_test(test_name, test_func)))
 
     # Summary
     print("\n" + "="*60)